@@ -1,16 +1,29 @@
+import importlib
+
 from pr_agent.config_loader import settings
-from pr_agent.git_providers.bitbucket_provider import BitbucketProvider
-from pr_agent.git_providers.github_provider import GithubProvider
-from pr_agent.git_providers.gitlab_provider import GitLabProvider
-from pr_agent.git_providers.local_git_provider import LocalGitProvider
 
+# Providers are imported on first use, so only the SDK of the configured provider gets loaded
 _GIT_PROVIDERS = {
-    'github': GithubProvider,
-    'gitlab': GitLabProvider,
-    'bitbucket': BitbucketProvider,
-    'local' : LocalGitProvider
+    'github': 'pr_agent.git_providers.github_provider:GithubProvider',
+    'gitlab': 'pr_agent.git_providers.gitlab_provider:GitLabProvider',
+    'bitbucket': 'pr_agent.git_providers.bitbucket_provider:BitbucketProvider',
+    'local' : 'pr_agent.git_providers.local_git_provider:LocalGitProvider'
 }
 
+
+def _load_provider(provider_id: str):
+    module_path, cls_name = _GIT_PROVIDERS[provider_id].split(':')
+    return getattr(importlib.import_module(module_path), cls_name)
+
+
+def __getattr__(name: str):
+    # Keep `from pr_agent.git_providers import GithubProvider` working without importing every provider eagerly
+    for provider_id, provider_path in _GIT_PROVIDERS.items():
+        if provider_path.endswith(f':{name}'):
+            return _load_provider(provider_id)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def get_git_provider():
     try:
         provider_id = settings.config.git_provider
@@ -18,4 +31,4 @@ def get_git_provider():
         raise ValueError("git_provider is a required attribute in the configuration file") from e
     if provider_id not in _GIT_PROVIDERS:
         raise ValueError(f"Unknown git provider: {provider_id}")
-    return _GIT_PROVIDERS[provider_id]
+    return _load_provider(provider_id)
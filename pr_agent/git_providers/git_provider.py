@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from dataclasses import dataclass
 
 # enum EDIT_TYPE (ADDED, DELETED, MODIFIED, RENAMED)
@@ -88,6 +89,21 @@ class GitProvider(ABC):
     def get_issue_comments(self):
         pass
 
+    def begin_batch(self):
+        pass
+
+    def commit_batch(self):
+        pass
+
+    # The PR updates made inside the block are sent together when it exits, even on error
+    @contextmanager
+    def batch(self):
+        self.begin_batch()
+        try:
+            yield self
+        finally:
+            self.commit_batch()
+
 
 def get_main_pr_language(languages, files) -> str:
     """
@@ -1,10 +1,13 @@
 import logging
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
-from urllib.parse import urlparse
 
 import gitlab
-from gitlab import GitlabGetError
+import requests
+from gitlab import GitlabGetError, GitlabHttpError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from pr_agent.config_loader import settings
 
@@ -13,6 +16,37 @@ from .git_provider import EDIT_TYPE, FilePatchInfo, GitProvider
 
 logger = logging.getLogger()
 
+# Upper bound on the number of comments created or deleted in parallel
+MAX_CONCURRENT_COMMENTS = 8
+# Size of the keep-alive connection pool shared by all requests to the GitLab host
+CONNECTION_POOL_SIZE = 32
+# Maximum number of paths requested in a single GraphQL blobs query
+GRAPHQL_BLOBS_BATCH_SIZE = 80
+# The GraphQL blobs query is read-only, so its POST can be retried, including when rate limited (honours Retry-After)
+GRAPHQL_RETRY = Retry(total=5, backoff_factor=0.5, status_forcelist=(429, 502, 503, 504),
+                      allowed_methods=frozenset(['POST']), raise_on_status=False)
+
+RE_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
+# (source, target) line number increments for each kind of patch line: deletion, addition and context
+PATCH_LINE_DELTAS = {'-': (1, 0), '+': (0, 1), ' ': (1, 1)}
+RE_MERGE_REQUEST_URL = re.compile(r"^https?://[^/]+/+(?P<project>.+?)(?:/-)?/merge_requests/(?P<id>\d+)(?:[/?#]|$)",
+                                  re.IGNORECASE)
+
+GRAPHQL_BLOBS_QUERY = """
+query($fullPath: ID!, $paths: [String!]!, $ref: String) {
+  project(fullPath: $fullPath) {
+    repository {
+      blobs(paths: $paths, ref: $ref) {
+        nodes {
+          path
+          rawBlob
+        }
+      }
+    }
+  }
+}
+"""
+
 
 class GitLabProvider(GitProvider):
 
@@ -23,18 +57,34 @@ class GitLabProvider(GitProvider):
         gitlab_access_token = settings.get("GITLAB.PERSONAL_ACCESS_TOKEN", None)
         if not gitlab_access_token:
             raise ValueError("GitLab personal access token is not set in the config file")
+        # Reuse connections across API calls instead of paying a TLS handshake per request
+        session = requests.Session()
+        # Rate limiting (429) is left to python-gitlab, which honours Retry-After. raise_on_status=False hands the
+        # last response back to python-gitlab, so exhausted retries still surface as GitlabError
+        adapter = HTTPAdapter(
+            pool_connections=CONNECTION_POOL_SIZE,
+            pool_maxsize=CONNECTION_POOL_SIZE,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), raise_on_status=False))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
         self.gl = gitlab.Gitlab(
             url=gitlab_url,
-            oauth_token=gitlab_access_token
+            oauth_token=gitlab_access_token,
+            session=session
         )
+        self.gl.session.mount(f"{self.gl.url}/api/graphql", HTTPAdapter(max_retries=GRAPHQL_RETRY))
+        self.max_concurrent_requests = max(1, int(settings.gitlab.max_concurrent_requests))
         self.id_project = None
         self.id_mr = None
+        self.project = None
         self.mr = None
+        self._changes_cache = None
         self.diff_files = None
+        self._diff_files_by_name = {}
         self.temp_comments = []
+        self._batch = False
+        self._batch_fields = set()
         self._set_merge_request(merge_request_url)
-        self.RE_HUNK_HEADER = re.compile(
-            r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
         self.incremental = incremental
 
     def is_supported(self, capability: str) -> bool:
@@ -49,62 +99,144 @@ class GitLabProvider(GitProvider):
 
     def _set_merge_request(self, merge_request_url: str):
         self.id_project, self.id_mr = self._parse_merge_request_url(merge_request_url)
+        # A lazy project object is built without an API call, only its sub-resources are requested
+        self.project = self.gl.projects.get(self.id_project, lazy=True)
         self.mr = self._get_merge_request()
-        try:
-            self.last_diff = self.mr.diffs.list(get_all=True)[-1]
-        except IndexError as e:
+        # The versions endpoint returns the newest version first, so the first page with one result is the latest one
+        diffs = self.mr.diffs.list(page=1, per_page=1)
+        if not diffs:
             logger.error(f"Could not get diff for merge request {self.id_mr}")
-            raise ValueError(f"Could not get diff for merge request {self.id_mr}") from e
+            raise ValueError(f"Could not get diff for merge request {self.id_mr}")
+        self.last_diff = diffs[0]
 
 
-    def _get_pr_file_content(self, file_path: str, branch: str) -> str:
+    def _get_pr_file_content(self, file_path: str, ref: str) -> str:
         try:
-            return self.gl.projects.get(self.id_project).files.get(file_path, branch).decode()
+            return self.project.files.raw(file_path=file_path, ref=ref).decode('utf-8', errors='replace')
         except GitlabGetError:
             # In case of file creation the method returns GitlabGetError (404 file not found).
             # In this case we return an empty string for the diff.
             return ''
 
+    def _fetch_blobs_graphql(self, paths: list[str], ref: str) -> dict[str, str]:
+        """
+        Fetch the content of several files on the same ref with batched GraphQL queries.
+        Paths that could not be fetched are missing from the returned dict.
+        """
+        contents = {}
+        for i in range(0, len(paths), GRAPHQL_BLOBS_BATCH_SIZE):
+            variables = {'fullPath': self.id_project, 'paths': paths[i:i + GRAPHQL_BLOBS_BATCH_SIZE], 'ref': ref}
+            try:
+                response = self.gl.session.post(f"{self.gl.url}/api/graphql",
+                                                json={'query': GRAPHQL_BLOBS_QUERY, 'variables': variables},
+                                                headers=self.gl.headers, timeout=self.gl.timeout)
+                if response.status_code == 429:
+                    # Still rate limited after the retries, falling back to one REST request per file would only
+                    # add load on the server
+                    raise GitlabHttpError(error_message="GitLab GraphQL API rate limit exceeded", response_code=429,
+                                          response_body=response.content)
+                response.raise_for_status()
+                nodes = response.json()['data']['project']['repository']['blobs']['nodes']
+            except (requests.RequestException, KeyError, TypeError) as e:
+                logging.warning(f"Could not fetch files of merge request {self.id_mr} with GraphQL, error: {e}")
+                continue
+            for node in nodes:
+                if node and node.get('rawBlob') is not None:
+                    contents[node['path']] = node['rawBlob']
+        return contents
+
+    def _get_pr_files_content(self, paths: list[str], ref: str) -> dict[str, str]:
+        contents = self._fetch_blobs_graphql(paths, ref)
+        # Fall back to the REST API for anything GraphQL did not return (e.g. files missing on this ref)
+        missing = [path for path in paths if path not in contents]
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+                contents.update(zip(missing, executor.map(self._get_pr_file_content, missing, [ref] * len(missing))))
+        return contents
+
+    def _changes(self) -> dict:
+        # The MR changes are requested by several methods, fetch them only once
+        if self._changes_cache is None:
+            self._changes_cache = self.mr.changes()
+        return self._changes_cache
+
     def get_diff_files(self) -> list[FilePatchInfo]:
-        diffs = self.mr.changes()['changes']
+        diffs = [diff for diff in self._changes()['changes'] if is_valid_file(diff['new_path'])]
+        # Read both versions at the commits of the latest MR diff rather than at the branch heads, so the contents
+        # match the patch even if the branches moved since
+        base_ref = self.last_diff.base_commit_sha or self.mr.target_branch
+        head_ref = self.last_diff.head_commit_sha or self.mr.source_branch
+        # Request every (path, ref) pair only once, even if several diffs refer to the same file version, and skip
+        # the versions that cannot exist: the base of an added file and the head of a deleted one
+        paths_by_ref = {base_ref: {}, head_ref: {}}
+        for diff in diffs:
+            if not diff['new_file']:
+                paths_by_ref[base_ref][diff['old_path']] = None
+            if not diff['deleted_file']:
+                paths_by_ref[head_ref][diff['new_path']] = None
+        contents = {ref: self._get_pr_files_content(list(paths), ref) if paths else {}
+                    for ref, paths in paths_by_ref.items()}
         diff_files = []
         for diff in diffs:
-            if is_valid_file(diff['new_path']):
-                original_file_content_str = self._get_pr_file_content(diff['old_path'], self.mr.target_branch)
-                new_file_content_str = self._get_pr_file_content(diff['new_path'], self.mr.source_branch)
-                edit_type = EDIT_TYPE.MODIFIED
-                if diff['new_file']:
-                    edit_type = EDIT_TYPE.ADDED
-                elif diff['deleted_file']:
-                    edit_type = EDIT_TYPE.DELETED
-                elif diff['renamed_file']:
-                    edit_type = EDIT_TYPE.RENAMED
-                try:
-                    if isinstance(original_file_content_str, bytes):
-                        original_file_content_str = bytes.decode(original_file_content_str, 'utf-8')
-                    if isinstance(new_file_content_str, bytes):
-                        new_file_content_str = bytes.decode(new_file_content_str, 'utf-8')
-                except UnicodeDecodeError:
-                    logging.warning(
-                        f"Cannot decode file {diff['old_path']} or {diff['new_path']} in merge request {self.id_mr}")
-                diff_files.append(
-                    FilePatchInfo(original_file_content_str, new_file_content_str, diff['diff'], diff['new_path'],
-                                  edit_type=edit_type,
-                                  old_filename=None if diff['old_path'] == diff['new_path'] else diff['old_path']))
+            original_file_content_str = '' if diff['new_file'] else contents[base_ref][diff['old_path']]
+            new_file_content_str = '' if diff['deleted_file'] else contents[head_ref][diff['new_path']]
+            edit_type = EDIT_TYPE.MODIFIED
+            if diff['new_file']:
+                edit_type = EDIT_TYPE.ADDED
+            elif diff['deleted_file']:
+                edit_type = EDIT_TYPE.DELETED
+            elif diff['renamed_file']:
+                edit_type = EDIT_TYPE.RENAMED
+            diff_files.append(
+                FilePatchInfo(original_file_content_str, new_file_content_str, diff['diff'], diff['new_path'],
+                              edit_type=edit_type,
+                              old_filename=None if diff['old_path'] == diff['new_path'] else diff['old_path']))
         self.diff_files = diff_files
+        self._diff_files_by_name = {file.filename: file for file in diff_files}
         return diff_files
 
     def get_files(self):
-        return [change['new_path'] for change in self.mr.changes()['changes']]
+        return [change['new_path'] for change in self._changes()['changes']]
 
     def publish_description(self, pr_title: str, pr_body: str):
         try:
             self.mr.title = pr_title
             self.mr.description = pr_body
-            self.mr.save()
+            if self._batch:
+                self._batch_fields.update(['title', 'description'])
+            else:
+                self.mr.save()
         except Exception as e:
             logging.exception(f"Could not update merge request {self.id_mr} description: {e}")
 
+    def begin_batch(self):
+        self._batch = True
+
+    def commit_batch(self):
+        # Save all the merge request fields updated since begin_batch in a single request
+        fields = sorted(self._batch_fields)
+        self._batch = False
+        self._batch_fields = set()
+        if not fields:
+            return
+        try:
+            self.mr.save()
+        except Exception as e:
+            logging.exception(f"Could not update merge request {self.id_mr} fields {fields}: {e}")
+            # Save the description and the labels on their own, so that a rejected one doesn't discard the other
+            groups = [group for group in (['title', 'description'], ['labels']) if set(group) & set(fields)]
+            if len(groups) > 1:
+                for group in groups:
+                    try:
+                        self.mr.manager.update(self.mr.get_id(), {field: getattr(self.mr, field) for field in group})
+                    except Exception as e:
+                        logging.exception(f"Could not update merge request {self.id_mr} fields {group}: {e}")
+            # The failed save leaves its changes pending on the merge request, reload it so they are not sent again
+            try:
+                self.mr.refresh()
+            except Exception as e:
+                logging.exception(f"Could not reload merge request {self.id_mr}: {e}")
+
     def publish_comment(self, mr_comment: str, is_temporary: bool = False):
         comment = self.mr.notes.create({'body': mr_comment})
         if is_temporary:
@@ -145,47 +277,48 @@ class GitLabProvider(GitProvider):
                                         'position': pos_obj})
 
     def publish_code_suggestions(self, code_suggestions: list):
-        for suggestion in code_suggestions:
-            try:
-                body = suggestion['body']
-                relevant_file = suggestion['relevant_file']
-                relevant_lines_start = suggestion['relevant_lines_start']
-                relevant_lines_end = suggestion['relevant_lines_end']
-
-                self.diff_files = self.diff_files if self.diff_files else self.get_diff_files()
-                target_file = None
-                for file in self.diff_files:
-                    if file.filename == relevant_file:
-                        if file.filename == relevant_file:
-                            target_file = file
-                            break
-                range = relevant_lines_end - relevant_lines_start # no need to add 1
-                body = body.replace('```suggestion', f'```suggestion:-0+{range}')
-                lines = target_file.head_file.splitlines()
-                relevant_line_in_file = lines[relevant_lines_start - 1]
-
-                # edit_type, found, source_line_no, target_file, target_line_no = self.find_in_file(target_file,
-                #                                                                            relevant_line_in_file)
-                # for code suggestions, we want to edit the new code
-                source_line_no = None
-                target_line_no = relevant_lines_start + 1
-                found = True
-                edit_type = 'addition'
+        try:
+            self.diff_files = self.diff_files if self.diff_files else self.get_diff_files()
+        except Exception as e:
+            logging.exception(f"Could not publish code suggestions, failed to get diff files: {e}")
+            return
+        # Each suggestion is an independent discussion, so post them concurrently. The trade-off is that the
+        # discussions are created in completion order, not in the order of code_suggestions
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_COMMENTS) as executor:
+            list(executor.map(self._publish_code_suggestion, code_suggestions))
+
+    def _publish_code_suggestion(self, suggestion: dict):
+        try:
+            body = suggestion['body']
+            relevant_file = suggestion['relevant_file']
+            relevant_lines_start = suggestion['relevant_lines_start']
+            relevant_lines_end = suggestion['relevant_lines_end']
+
+            target_file = self._diff_files_by_name.get(relevant_file)
+            range = relevant_lines_end - relevant_lines_start # no need to add 1
+            body = body.replace('```suggestion', f'```suggestion:-0+{range}')
+            lines = target_file.head_file.splitlines()
+            relevant_line_in_file = lines[relevant_lines_start - 1]
+
+            # edit_type, found, source_line_no, target_file, target_line_no = self.find_in_file(target_file,
+            #                                                                            relevant_line_in_file)
+            # for code suggestions, we want to edit the new code
+            source_line_no = None
+            target_line_no = relevant_lines_start + 1
+            found = True
+            edit_type = 'addition'
 
-                self.send_inline_comment(body, edit_type, found, relevant_file, relevant_line_in_file, source_line_no,
-                                         target_file, target_line_no)
-            except Exception as e:
-                logging.exception(f"Could not publish code suggestion:\nsuggestion: {suggestion}\nerror: {e}")
+            self.send_inline_comment(body, edit_type, found, relevant_file, relevant_line_in_file, source_line_no,
+                                     target_file, target_line_no)
+        except Exception as e:
+            logging.exception(f"Could not publish code suggestion:\nsuggestion: {suggestion}\nerror: {e}")
 
     def search_line(self, relevant_file, relevant_line_in_file):
-        target_file = None
-
+        file = self._diff_files_by_name.get(relevant_file)
+        if file:
+            return self.find_in_file(file, relevant_line_in_file)
         edit_type = self.get_edit_type(relevant_line_in_file)
-        for file in self.diff_files:
-            if file.filename == relevant_file:
-                edit_type, found, source_line_no, target_file, target_line_no = self.find_in_file(file,
-                                                                                                  relevant_line_in_file)
-        return edit_type, found, source_line_no, target_file, target_line_no
+        return edit_type, False, 0, None, 0
 
     def find_in_file(self, file, relevant_line_in_file):
         edit_type = 'context'
@@ -194,30 +327,29 @@ class GitLabProvider(GitProvider):
         found = False
         target_file = file
         patch = file.patch
+        # The model often adds a '+' to the beginning of the relevant_line_in_file even if originally
+        # it's a context line, so also look for the line without it
+        alt_relevant_line = relevant_line_in_file[1:].lstrip() if relevant_line_in_file.startswith('+') else None
         patch_lines = patch.splitlines()
         for line in patch_lines:
-            if line.startswith('@@'):
-                match = self.RE_HUNK_HEADER.match(line)
+            first_char = line[:1]
+            if first_char == '@':
+                match = RE_HUNK_HEADER.match(line)
                 if not match:
                     continue
                 start_old, size_old, start_new, size_new, _ = match.groups()
                 source_line_no = int(start_old)
                 target_line_no = int(start_new)
                 continue
-            if line.startswith('-'):
-                source_line_no += 1
-            elif line.startswith('+'):
-                target_line_no += 1
-            elif line.startswith(' '):
-                source_line_no += 1
-                target_line_no += 1
+            delta = PATCH_LINE_DELTAS.get(first_char)
+            if delta:
+                source_line_no += delta[0]
+                target_line_no += delta[1]
             if relevant_line_in_file in line:
                 found = True
                 edit_type = self.get_edit_type(line)
                 break
-            elif relevant_line_in_file[0] == '+' and relevant_line_in_file[1:].lstrip() in line:
-                # The model often adds a '+' to the beginning of the relevant_line_in_file even if originally
-                # it's a context line
+            elif alt_relevant_line is not None and alt_relevant_line in line:
                 found = True
                 edit_type = self.get_edit_type(line)
                 break
@@ -233,8 +365,8 @@ class GitLabProvider(GitProvider):
 
     def remove_initial_comment(self):
         try:
-            for comment in self.temp_comments:
-                comment.delete()
+            with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_COMMENTS) as executor:
+                list(executor.map(lambda comment: comment.delete(), self.temp_comments))
         except Exception as e:
             logging.exception(f"Failed to remove temp comments, error: {e}")
 
@@ -242,7 +374,7 @@ class GitLabProvider(GitProvider):
         return self.mr.title
 
     def get_languages(self):
-        languages = self.gl.projects.get(self.id_project).languages()
+        languages = self.project.languages()
         return languages
 
     def get_pr_branch(self):
@@ -255,32 +387,14 @@ class GitLabProvider(GitProvider):
         raise NotImplementedError("GitLab provider does not support issue comments yet")
 
     def _parse_merge_request_url(self, merge_request_url: str) -> Tuple[str, int]:
-        parsed_url = urlparse(merge_request_url)
-
-        path_parts = parsed_url.path.strip('/').split('/')
-        if 'merge_requests' not in path_parts:
+        match = RE_MERGE_REQUEST_URL.match(merge_request_url.strip())
+        if not match:
             raise ValueError("The provided URL does not appear to be a GitLab merge request URL")
-
-        mr_index = path_parts.index('merge_requests')
-        # Ensure there is an ID after 'merge_requests'
-        if len(path_parts) <= mr_index + 1:
-            raise ValueError("The provided URL does not contain a merge request ID")
-
-        try:
-            mr_id = int(path_parts[mr_index + 1])
-        except ValueError as e:
-            raise ValueError("Unable to convert merge request ID to integer") from e
-
-        # Handle special delimiter (-)
-        project_path = "/".join(path_parts[:mr_index])
-        if project_path.endswith('/-'):
-            project_path = project_path[:-2]
-
-        # Return the path before 'merge_requests' and the ID
-        return project_path, mr_id
+        # Return the path before 'merge_requests' (without the special '-' delimiter) and the ID
+        return match.group('project'), int(match.group('id'))
 
     def _get_merge_request(self):
-        mr = self.gl.projects.get(self.id_project).mergerequests.get(self.id_mr)
+        mr = self.project.mergerequests.get(self.id_mr)
         return mr
 
     def get_user_id(self):
@@ -288,8 +402,11 @@ class GitLabProvider(GitProvider):
 
     def publish_labels(self, pr_types):
         try:
-            self.mr.labels = list(set(pr_types))
-            self.mr.save()
+            self.mr.labels = list(dict.fromkeys(pr_types))
+            if self._batch:
+                self._batch_fields.add('labels')
+            else:
+                self.mr.save()
         except Exception as e:
             logging.exception(f"Failed to publish labels, error: {e}")
 
@@ -10,7 +10,7 @@ from pr_agent.algo.pr_processing import get_pr_diff, retry_with_fallback_models
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import try_fix_json, update_settings_from_args
 from pr_agent.config_loader import settings
-from pr_agent.git_providers import BitbucketProvider, get_git_provider
+from pr_agent.git_providers import get_git_provider
 from pr_agent.git_providers.git_provider import get_main_pr_language
 
 
@@ -42,7 +42,7 @@ class PRCodeSuggestions:
                                           settings.pr_code_suggestions_prompt.user)
 
     async def suggest(self):
-        assert type(self.git_provider) != BitbucketProvider, "Bitbucket is not supported for now"
+        assert settings.config.git_provider != "bitbucket", "Bitbucket is not supported for now"
 
         logging.info('Generating code suggestions for PR...')
         if settings.config.publish_output:
@@ -73,12 +73,13 @@ class PRDescription:
             if settings.pr_description.publish_description_as_comment:
                 self.git_provider.publish_comment(markdown_text)
             else:
-                self.git_provider.publish_description(pr_title, pr_body)
-                if self.git_provider.is_supported("get_labels"):
-                    current_labels = self.git_provider.get_labels()
-                    if current_labels is None:
-                        current_labels = []
-                    self.git_provider.publish_labels(pr_types + current_labels)
+                with self.git_provider.batch():
+                    self.git_provider.publish_description(pr_title, pr_body)
+                    if self.git_provider.is_supported("get_labels"):
+                        current_labels = self.git_provider.get_labels()
+                        if current_labels is None:
+                            current_labels = []
+                        self.git_provider.publish_labels(pr_types + current_labels)
             self.git_provider.remove_initial_comment()
         
         return ""
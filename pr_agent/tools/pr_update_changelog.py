@@ -11,7 +11,7 @@ from pr_agent.algo.pr_processing import get_pr_diff, retry_with_fallback_models
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.config_loader import settings
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.git_providers import get_git_provider, GithubProvider
+from pr_agent.git_providers import get_git_provider
 from pr_agent.git_providers.git_provider import get_main_pr_language
 
 CHANGELOG_LINES = 50
@@ -47,7 +47,7 @@ class PRUpdateChangelog:
                                           settings.pr_update_changelog_prompt.user)
 
     async def update_changelog(self):
-        assert type(self.git_provider) == GithubProvider, "Currently only Github is supported"
+        assert settings.config.git_provider == "github", "Currently only Github is supported"
 
         logging.info('Updating the changelog...')
         if settings.config.publish_output:
@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pr_agent.config_loader import settings
+
+GITLAB_MR_URL = 'https://gitlab.example.com/group/project/-/merge_requests/1'
+BASE_SHA = 'b' * 40
+START_SHA = 's' * 40
+HEAD_SHA = 'h' * 40
+
+
+class FakeMergeRequest:
+    def __init__(self):
+        self.title = 'title'
+        self.description = 'description'
+        self.labels = []
+        self.target_branch = 'main'
+        self.source_branch = 'feature'
+        self.changes_list = []
+        self.rejected_fields = set()
+        self.saved = []
+        self.refreshed = False
+        self.manager = SimpleNamespace(update=self._update)
+        self.discussions_created = []
+        self.discussions = SimpleNamespace(create=self.discussions_created.append)
+
+    def changes(self):
+        return {'changes': self.changes_list}
+
+    def get_id(self):
+        return 1
+
+    def save(self):
+        self._update(self.get_id(), {'title': self.title, 'description': self.description, 'labels': self.labels})
+
+    def refresh(self):
+        self.refreshed = True
+
+    def _update(self, mr_id, data):
+        rejected = self.rejected_fields.intersection(data)
+        if rejected:
+            raise ValueError(f'{sorted(rejected)} rejected')
+        self.saved.append(data)
+
+
+@pytest.fixture
+def gitlab_provider(monkeypatch):
+    """A GitLabProvider built through __init__, with the merge request served by in-memory fakes instead of GitLab."""
+    from pr_agent.git_providers.gitlab_provider import GitLabProvider
+
+    def set_merge_request(self, merge_request_url):
+        self.id_project, self.id_mr = self._parse_merge_request_url(merge_request_url)
+        self.project = SimpleNamespace()
+        self.mr = FakeMergeRequest()
+        self.last_diff = SimpleNamespace(base_commit_sha=BASE_SHA, start_commit_sha=START_SHA,
+                                         head_commit_sha=HEAD_SHA)
+
+    settings.set('GITLAB.PERSONAL_ACCESS_TOKEN', 'test-token')
+    monkeypatch.setattr(GitLabProvider, '_set_merge_request', set_merge_request)
+    return GitLabProvider(GITLAB_MR_URL)
@@ -0,0 +1,63 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from pr_agent.config_loader import settings
+from pr_agent.git_providers import get_git_provider
+from pr_agent.git_providers.bitbucket_provider import BitbucketProvider
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.gitlab_provider import GitLabProvider
+from pr_agent.git_providers.local_git_provider import LocalGitProvider
+
+
+@pytest.fixture
+def git_provider_setting():
+    original = settings.config.git_provider
+    yield
+    settings.config.git_provider = original
+
+
+class TestGetGitProvider:
+    @pytest.mark.parametrize('provider_id, provider_class', [
+        ('github', GithubProvider),
+        ('gitlab', GitLabProvider),
+        ('bitbucket', BitbucketProvider),
+        ('local', LocalGitProvider),
+    ])
+    def test_returns_provider_class(self, git_provider_setting, provider_id, provider_class):
+        settings.config.git_provider = provider_id
+        assert get_git_provider() is provider_class
+
+    def test_unknown_provider(self, git_provider_setting):
+        settings.config.git_provider = 'unknown'
+        with pytest.raises(ValueError):
+            get_git_provider()
+
+    # Provider classes can still be imported from the package even though they are loaded lazily
+    def test_import_provider_from_package(self):
+        from pr_agent.git_providers import GithubProvider as PackageGithubProvider
+        from pr_agent.git_providers import GitLabProvider as PackageGitLabProvider
+        assert PackageGithubProvider is GithubProvider
+        assert PackageGitLabProvider is GitLabProvider
+
+    def test_unknown_attribute(self):
+        import pr_agent.git_providers
+        with pytest.raises(AttributeError):
+            pr_agent.git_providers.UnknownProvider
+
+    # Only the selected provider is imported, so its dependencies are the only ones that are loaded
+    def test_other_providers_are_not_imported(self):
+        code = (
+            "import sys\n"
+            "from pr_agent.config_loader import settings\n"
+            "from pr_agent.git_providers import get_git_provider\n"
+            "settings.config.git_provider = 'github'\n"
+            "get_git_provider()\n"
+            "assert 'gitlab' not in sys.modules, 'gitlab was imported'\n"
+            "assert 'atlassian' not in sys.modules, 'atlassian was imported'\n"
+        )
+        result = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).parents[2],
+                                capture_output=True, text=True)
+        assert result.returncode == 0, result.stderr
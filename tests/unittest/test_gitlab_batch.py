@@ -0,0 +1,44 @@
+import pytest
+
+
+class TestGitLabBatch:
+    def test_description_and_labels_saved_once(self, gitlab_provider):
+        mr = gitlab_provider.mr
+        with gitlab_provider.batch():
+            gitlab_provider.publish_description('new title', 'body')
+            gitlab_provider.publish_labels(['Bug fix', 'Tests', 'Bug fix'])
+        assert mr.saved == [{'title': 'new title', 'description': 'body', 'labels': ['Bug fix', 'Tests']}]
+        assert not gitlab_provider._batch
+
+    def test_batch_committed_on_error(self, gitlab_provider):
+        mr = gitlab_provider.mr
+        with pytest.raises(RuntimeError):
+            with gitlab_provider.batch():
+                gitlab_provider.publish_description('new title', 'body')
+                raise RuntimeError('get_labels failed')
+        assert mr.saved == [{'title': 'new title', 'description': 'body', 'labels': []}]
+        assert not gitlab_provider._batch
+
+    def test_rejected_labels_do_not_discard_description(self, gitlab_provider):
+        mr = gitlab_provider.mr
+        mr.rejected_fields = {'labels'}
+        with gitlab_provider.batch():
+            gitlab_provider.publish_description('new title', 'body')
+            gitlab_provider.publish_labels(['Bug fix'])
+        assert mr.saved == [{'title': 'new title', 'description': 'body'}]
+        assert mr.refreshed
+
+    def test_rejected_description_does_not_discard_labels(self, gitlab_provider):
+        mr = gitlab_provider.mr
+        mr.rejected_fields = {'description'}
+        with gitlab_provider.batch():
+            gitlab_provider.publish_description('new title', 'body')
+            gitlab_provider.publish_labels(['Bug fix'])
+        assert mr.saved == [{'labels': ['Bug fix']}]
+        assert mr.refreshed
+
+    def test_empty_batch_does_not_save(self, gitlab_provider):
+        mr = gitlab_provider.mr
+        with gitlab_provider.batch():
+            pass
+        assert mr.saved == []
@@ -0,0 +1,42 @@
+import pytest
+
+from pr_agent.git_providers.git_provider import FilePatchInfo
+
+
+def suggestion(relevant_file, line):
+    return {'body': f'```suggestion\n{relevant_file}:{line}\n```', 'relevant_file': relevant_file,
+            'relevant_lines_start': line, 'relevant_lines_end': line}
+
+
+@pytest.fixture
+def diff_files(gitlab_provider):
+    files = [FilePatchInfo('', '\n'.join(f'{name} line {i}' for i in range(1, 11)), '', name)
+             for name in ('a.py', 'b.py')]
+    gitlab_provider.diff_files = files
+    gitlab_provider._diff_files_by_name = {file.filename: file for file in files}
+    return files
+
+
+class TestPublishCodeSuggestions:
+    def test_every_suggestion_is_posted(self, gitlab_provider, diff_files):
+        suggestions = [suggestion(name, line) for name in ('a.py', 'b.py') for line in range(1, 11)]
+        gitlab_provider.publish_code_suggestions(suggestions)
+        created = gitlab_provider.mr.discussions_created
+        # The discussions are posted concurrently, so only the set of posted suggestions is deterministic
+        assert sorted(d['body'] for d in created) == sorted(
+            s['body'].replace('```suggestion', '```suggestion:-0+0') for s in suggestions)
+        assert all(d['position']['head_sha'] == gitlab_provider.last_diff.head_commit_sha for d in created)
+
+    def test_failed_suggestion_does_not_stop_the_others(self, gitlab_provider, diff_files):
+        created = gitlab_provider.mr.discussions_created
+
+        def create(data):
+            if 'a.py:2' in data['body']:
+                raise ValueError('position rejected')
+            created.append(data)
+
+        gitlab_provider.mr.discussions.create = create
+        suggestions = [suggestion('a.py', 1), suggestion('a.py', 2), suggestion('unknown.py', 1),
+                       suggestion('b.py', 3)]
+        gitlab_provider.publish_code_suggestions(suggestions)
+        assert sorted(d['position']['new_path'] for d in created) == ['a.py', 'b.py']
@@ -0,0 +1,150 @@
+from types import SimpleNamespace
+
+import pytest
+import requests
+from gitlab import GitlabHttpError
+
+from pr_agent.git_providers.git_provider import EDIT_TYPE
+from pr_agent.git_providers.gitlab_provider import GRAPHQL_BLOBS_BATCH_SIZE
+
+
+class FakeResponse:
+    def __init__(self, payload=None, status_code=200):
+        self.payload = payload
+        self.status_code = status_code
+        self.content = b''
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} Error')
+
+    def json(self):
+        return self.payload
+
+
+def blobs_payload(nodes):
+    return {'data': {'project': {'repository': {'blobs': {'nodes': nodes}}}}}
+
+
+def all_blobs(ref, paths):
+    return FakeResponse(blobs_payload([{'path': path, 'rawBlob': f'{ref}:{path}'} for path in paths]))
+
+
+@pytest.fixture
+def gitlab_api(gitlab_provider, monkeypatch):
+    """Records the GraphQL and REST requests of gitlab_provider. GraphQL answers with api.respond(ref, paths)."""
+    api = SimpleNamespace(posted=[], rest_calls=[], respond=all_blobs)
+
+    def post(url, json, headers, timeout):
+        variables = json['variables']
+        api.posted.append((variables['ref'], variables['paths']))
+        return api.respond(variables['ref'], variables['paths'])
+
+    def get_pr_file_content(file_path, ref):
+        api.rest_calls.append((file_path, ref))
+        return f'rest:{file_path}'
+
+    monkeypatch.setattr(gitlab_provider.gl.session, 'post', post)
+    monkeypatch.setattr(gitlab_provider, '_get_pr_file_content', get_pr_file_content)
+    return api
+
+
+def change(old_path, new_path=None, new_file=False, deleted_file=False, renamed_file=False):
+    return {'old_path': old_path, 'new_path': new_path or old_path, 'new_file': new_file,
+            'deleted_file': deleted_file, 'renamed_file': renamed_file, 'diff': f'@@ -1 +1 @@\n+{old_path}'}
+
+
+class TestGetPrFilesContent:
+    def test_all_paths_returned_by_graphql(self, gitlab_provider, gitlab_api):
+        assert gitlab_provider._get_pr_files_content(['a.py', 'b.py'], 'sha') == {'a.py': 'sha:a.py',
+                                                                                  'b.py': 'sha:b.py'}
+        assert gitlab_api.rest_calls == []
+
+    def test_null_and_missing_blobs_fall_back_to_rest(self, gitlab_provider, gitlab_api):
+        gitlab_api.respond = lambda ref, paths: FakeResponse(blobs_payload([{'path': 'a.py', 'rawBlob': 'A'},
+                                                                            {'path': 'b.py', 'rawBlob': None},
+                                                                            None]))
+        contents = gitlab_provider._get_pr_files_content(['a.py', 'b.py', 'c.py'], 'sha')
+        assert contents == {'a.py': 'A', 'b.py': 'rest:b.py', 'c.py': 'rest:c.py'}
+        assert sorted(gitlab_api.rest_calls) == [('b.py', 'sha'), ('c.py', 'sha')]
+
+    def test_null_project_falls_back_to_rest(self, gitlab_provider, gitlab_api):
+        gitlab_api.respond = lambda ref, paths: FakeResponse({'data': {'project': None}})
+        assert gitlab_provider._get_pr_files_content(['a.py'], 'sha') == {'a.py': 'rest:a.py'}
+
+    def test_failed_batch_falls_back_to_rest(self, gitlab_provider, gitlab_api):
+        gitlab_api.respond = lambda ref, paths: FakeResponse(status_code=500)
+        contents = gitlab_provider._get_pr_files_content(['a.py', 'b.py'], 'sha')
+        assert contents == {'a.py': 'rest:a.py', 'b.py': 'rest:b.py'}
+
+    def test_rate_limited_batch_does_not_fall_back_to_rest(self, gitlab_provider, gitlab_api):
+        gitlab_api.respond = lambda ref, paths: FakeResponse(status_code=429)
+        with pytest.raises(GitlabHttpError):
+            gitlab_provider._get_pr_files_content(['a.py', 'b.py'], 'sha')
+        assert gitlab_api.rest_calls == []
+
+    def test_paths_are_split_into_batches(self, gitlab_provider, gitlab_api):
+        paths = [f'file_{i}.py' for i in range(GRAPHQL_BLOBS_BATCH_SIZE + 1)]
+        gitlab_api.respond = lambda ref, batch: all_blobs(ref, batch) if len(batch) > 1 else FakeResponse(
+            status_code=503)
+        contents = gitlab_provider._get_pr_files_content(paths, 'sha')
+        assert [len(batch) for _, batch in gitlab_api.posted] == [GRAPHQL_BLOBS_BATCH_SIZE, 1]
+        assert gitlab_api.rest_calls == [(paths[-1], 'sha')]
+        assert contents[paths[0]] == f'sha:{paths[0]}'
+        assert contents[paths[-1]] == f'rest:{paths[-1]}'
+
+
+class TestGetDiffFiles:
+    def test_contents_fetched_once_per_version_at_diff_shas(self, gitlab_provider, gitlab_api):
+        base_sha, head_sha = gitlab_provider.last_diff.base_commit_sha, gitlab_provider.last_diff.head_commit_sha
+        gitlab_provider.mr.changes_list = [
+            change('a.py'),
+            change('b.py', new_file=True),
+            change('c.py', deleted_file=True),
+            change('d_old.py', 'd.py', renamed_file=True),
+            change('util.py'),
+            change('util.py', 'util_copy.py', renamed_file=True),
+        ]
+        gitlab_provider.get_diff_files()
+        # Only the immutable SHAs of the latest diff are used, never the branch names
+        assert gitlab_api.posted == [
+            (base_sha, ['a.py', 'c.py', 'd_old.py', 'util.py']),
+            (head_sha, ['a.py', 'b.py', 'd.py', 'util.py', 'util_copy.py']),
+        ]
+        assert gitlab_api.rest_calls == []
+
+    def test_diff_files(self, gitlab_provider, gitlab_api):
+        base_sha, head_sha = gitlab_provider.last_diff.base_commit_sha, gitlab_provider.last_diff.head_commit_sha
+        gitlab_provider.mr.changes_list = [
+            change('a.py'),
+            change('b.py', new_file=True),
+            change('c.py', deleted_file=True),
+            change('d_old.py', 'd.py', renamed_file=True),
+        ]
+        diff_files = gitlab_provider.get_diff_files()
+        assert [(f.filename, f.old_filename, f.edit_type) for f in diff_files] == [
+            ('a.py', None, EDIT_TYPE.MODIFIED),
+            ('b.py', None, EDIT_TYPE.ADDED),
+            ('c.py', None, EDIT_TYPE.DELETED),
+            ('d.py', 'd_old.py', EDIT_TYPE.RENAMED),
+        ]
+        assert [(f.base_file, f.head_file) for f in diff_files] == [
+            (f'{base_sha}:a.py', f'{head_sha}:a.py'),
+            ('', f'{head_sha}:b.py'),
+            (f'{base_sha}:c.py', ''),
+            (f'{base_sha}:d_old.py', f'{head_sha}:d.py'),
+        ]
+        assert gitlab_provider.diff_files == diff_files
+
+    def test_invalid_files_are_skipped(self, gitlab_provider, gitlab_api):
+        gitlab_provider.mr.changes_list = [change('a.py'), change('logo.png'), change('b.py', new_file=True)]
+        diff_files = gitlab_provider.get_diff_files()
+        assert [f.filename for f in diff_files] == ['a.py', 'b.py']
+        assert all('logo.png' not in paths for _, paths in gitlab_api.posted)
+
+    def test_only_added_files(self, gitlab_provider, gitlab_api):
+        head_sha = gitlab_provider.last_diff.head_commit_sha
+        gitlab_provider.mr.changes_list = [change('a.py', new_file=True), change('b.py', new_file=True)]
+        diff_files = gitlab_provider.get_diff_files()
+        assert gitlab_api.posted == [(head_sha, ['a.py', 'b.py'])]
+        assert [f.base_file for f in diff_files] == ['', '']
@@ -0,0 +1,53 @@
+import pytest
+
+from pr_agent.git_providers.git_provider import FilePatchInfo
+
+PATCH = """@@ -1,3 +1,4 @@
+ def foo():
+-    return 1
++    x = 2
++    return x
+
+@@ -10,2 +11,3 @@
+ class Bar:
++    baz = 3
+     pass"""
+
+
+@pytest.fixture
+def find_in_file(gitlab_provider):
+    def find(patch, relevant_line_in_file):
+        file = FilePatchInfo('', '', patch, 'foo.py')
+        edit_type, found, source_line_no, target_file, target_line_no = gitlab_provider.find_in_file(
+            file, relevant_line_in_file)
+        assert target_file is file
+        return edit_type, found, source_line_no, target_line_no
+    return find
+
+
+class TestFindInFile:
+    def test_addition_line_numbers(self, find_in_file):
+        assert find_in_file(PATCH, '+    x = 2') == ('addition', True, 3, 3)
+        assert find_in_file(PATCH, '+    return x') == ('addition', True, 3, 4)
+
+    def test_deletion_line_numbers(self, find_in_file):
+        assert find_in_file(PATCH, '-    return 1') == ('deletion', True, 3, 2)
+
+    def test_line_numbers_restart_at_each_hunk(self, find_in_file):
+        assert find_in_file(PATCH, '+    baz = 3') == ('addition', True, 11, 13)
+
+    # The model often prefixes context lines with '+', they must still be found as context lines
+    def test_plus_prefix_on_context_line(self, find_in_file):
+        assert find_in_file(PATCH, '+class Bar:') == ('context', True, 11, 12)
+        assert find_in_file(PATCH, '+def foo():') == ('context', True, 2, 2)
+
+    def test_crlf_patch(self, find_in_file):
+        crlf_patch = PATCH.replace('\n', '\r\n')
+        assert find_in_file(crlf_patch, '+    x = 2') == ('addition', True, 3, 3)
+        assert find_in_file(crlf_patch, '+    baz = 3') == ('addition', True, 11, 13)
+        assert find_in_file(crlf_patch, '+class Bar:') == ('context', True, 11, 12)
+
+    def test_line_not_found(self, find_in_file):
+        edit_type, found, _, _ = find_in_file(PATCH, 'not in the patch')
+        assert edit_type == 'context'
+        assert not found
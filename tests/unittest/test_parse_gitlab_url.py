@@ -0,0 +1,29 @@
+import pytest
+
+
+class TestParseMergeRequestUrl:
+    @pytest.mark.parametrize('url, expected', [
+        ('https://gitlab.com/group/project/-/merge_requests/12', ('group/project', 12)),
+        ('https://gitlab.com/group/project/merge_requests/12', ('group/project', 12)),
+        ('https://gitlab.com/group/sub/project/-/merge_requests/12', ('group/sub/project', 12)),
+        ('https://gitlab.com/group/project/-/merge_requests/12/diffs', ('group/project', 12)),
+        ('https://gitlab.com/group/project/-/merge_requests/12?tab=commits', ('group/project', 12)),
+        ('https://gitlab.com/group/project/-/merge_requests/12#note_345', ('group/project', 12)),
+        ('http://gitlab.example.com:8080/group/project/-/merge_requests/7', ('group/project', 7)),
+        ('HTTPS://gitlab.com/group/project/-/merge_requests/12', ('group/project', 12)),
+        ('https://gitlab.com/group/project/-/merge_requests/12 ', ('group/project', 12)),
+        ('https://gitlab.com//group/project/-/merge_requests/1', ('group/project', 1)),
+    ])
+    def test_valid_urls(self, gitlab_provider, url, expected):
+        assert gitlab_provider._parse_merge_request_url(url) == expected
+
+    @pytest.mark.parametrize('url', [
+        'https://gitlab.com/group/project/-/issues/12',
+        'https://gitlab.com/group/project/-/merge_requests/',
+        'https://gitlab.com/group/project/-/merge_requests/abc',
+        'https://gitlab.com/group/project/-/merge_requests/12abc',
+        'not a url',
+    ])
+    def test_invalid_urls(self, gitlab_provider, url):
+        with pytest.raises(ValueError):
+            gitlab_provider._parse_merge_request_url(url)